@@ -1,35 +1,103 @@
-import json
-import boto3
-import uuid
+from __future__ import annotations
+
+import orjson
 from datetime import datetime
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Tuple
 import os
+import re
 
-# Clientes AWS
-sqs = boto3.client('sqs')
-dynamodb = boto3.resource('dynamodb')
+# Client SQS (criado por get_sqs_client e reutilizado entre invocações warm)
+_sqs = None
 
 # Variáveis de ambiente
 QUEUE_URL = os.environ.get('QUEUE_URL')
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'tickets')
 
+# Limite de entradas por chamada do SQS send_message_batch
+SQS_BATCH_SIZE = 10
+
+# Caracteres não aceitos pelo SQS no MessageBody que o orjson não escapa
+SQS_BODY_ESCAPES = {0xFFFE: '\\ufffe', 0xFFFF: '\\uffff'}
+
+# Tamanho máximo do body aceito, em bytes UTF-8 (bem acima de qualquer ticket legítimo)
+MAX_BODY_SIZE = 32 * 1024
+
+# Validações de formato (compiladas uma única vez no INIT)
+CPF_STRIP = str.maketrans('', '', '.-')
+CPF_RE = re.compile(r'\d{11}')
+EMAIL_RE = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
+
+# Schema dos campos obrigatórios
+REQUIRED_FIELDS = (
+    ('nome_completo', str),
+    ('cpf', str),
+    ('email', str),
+    ('telefone', str),
+    ('endereco', dict),
+    ('aparelho', dict)
+)
+ENDERECO_FIELDS = frozenset({'rua', 'numero', 'cidade', 'estado', 'cep'})
+APARELHO_FIELDS = frozenset({'marca', 'modelo', 'numero_serie', 'data_compra', 'nota_fiscal'})
+
+# Headers compartilhados por todas as respostas da API
+RESPONSE_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+def build_response(status_code: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Monta a resposta no formato esperado pelo API Gateway.
+    """
+    return {
+        'statusCode': status_code,
+        'headers': RESPONSE_HEADERS,
+        'body': orjson.dumps(payload).decode()
+    }
+
+def build_message_body(ticket_data: Dict[str, Any]) -> str:
+    """
+    Serializa o ticket para o body da mensagem SQS.
+    
+    O orjson grava caracteres não-ASCII sem escape, mas o SQS rejeita U+FFFE e
+    U+FFFF no MessageBody. Em JSON eles só aparecem dentro de strings, então
+    trocá-los pela sequência \\uXXXX mantém o documento equivalente.
+    """
+    return orjson.dumps(ticket_data).decode().translate(SQS_BODY_ESCAPES)
+
+def get_sqs_client():
+    """
+    Retorna o client SQS, criado apenas no primeiro uso.
+    
+    boto3 e botocore são importados aqui para que o modo desenvolvimento
+    (sem QUEUE_URL) não pague o custo de importá-los.
+    """
+    global _sqs
+    if _sqs is None:
+        import boto3
+        from botocore.config import Config
+        
+        # Conexões mantidas vivas entre invocações warm
+        _sqs = boto3.client('sqs', config=Config(
+            tcp_keepalive=True,
+            retries={'mode': 'adaptive', 'max_attempts': 10},
+            connect_timeout=1,
+            read_timeout=3
+        ))
+    return _sqs
+
+# Com a fila configurada, o client é criado no INIT e não na primeira requisição
+if QUEUE_URL:
+    get_sqs_client()
+
 def validate_required_fields(data: Dict[str, Any]) -> Tuple[bool, str]:
     """
     Valida os campos obrigatórios para abertura de ticket.
     
     Retorna: (is_valid, error_message)
     """
-    required_fields = {
-        'nome_completo': str,
-        'cpf': str,
-        'email': str,
-        'telefone': str,
-        'endereco': dict,
-        'aparelho': dict
-    }
-    
     # Valida campos principais
-    for field, field_type in required_fields.items():
+    for field, field_type in REQUIRED_FIELDS:
         if field not in data:
             return False, f"Campo obrigatório ausente: {field}"
         
@@ -37,147 +105,230 @@ def validate_required_fields(data: Dict[str, Any]) -> Tuple[bool, str]:
             return False, f"Campo {field} deve ser do tipo {field_type.__name__}"
     
     # Valida estrutura do endereço
-    endereco_fields = ['rua', 'numero', 'cidade', 'estado', 'cep']
-    for field in endereco_fields:
-        if field not in data['endereco']:
-            return False, f"Campo obrigatório no endereço: {field}"
+    missing = ENDERECO_FIELDS.difference(data['endereco'])
+    if missing:
+        return False, f"Campo obrigatório no endereço: {', '.join(sorted(missing))}"
     
     # Valida estrutura do aparelho
-    aparelho_fields = ['marca', 'modelo', 'numero_serie', 'data_compra', 'nota_fiscal']
-    for field in aparelho_fields:
-        if field not in data['aparelho']:
-            return False, f"Campo obrigatório no aparelho: {field}"
+    missing = APARELHO_FIELDS.difference(data['aparelho'])
+    if missing:
+        return False, f"Campo obrigatório no aparelho: {', '.join(sorted(missing))}"
     
     # Valida formato de CPF (básico)
-    cpf = data['cpf'].replace('.', '').replace('-', '')
-    if len(cpf) != 11 or not cpf.isdigit():
+    if not CPF_RE.fullmatch(data['cpf'].translate(CPF_STRIP)):
         return False, "CPF inválido"
     
     # Valida formato de email (básico)
-    if '@' not in data['email'] or '.' not in data['email'].split('@')[1]:
+    if not EMAIL_RE.fullmatch(data['email']):
         return False, "Email inválido"
     
     return True, ""
 
+def build_ticket(body: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+    """
+    Monta o objeto do ticket a partir do body validado.
+    
+    O ticket_id são 128 bits aleatórios em hexadecimal.
+    """
+    return {
+        'ticket_id': os.urandom(16).hex(),
+        'status': 'PENDENTE',
+        'data_abertura': timestamp,
+        'nome_completo': body['nome_completo'],
+        'cpf': body['cpf'],
+        'email': body['email'],
+        'telefone': body['telefone'],
+        'endereco': body['endereco'],
+        'aparelho': body['aparelho'],
+        'observacoes': body.get('observacoes', ''),
+        'created_at': timestamp
+    }
+
+def build_message_attributes(ticket_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Monta os atributos da mensagem SQS do ticket.
+    """
+    return {
+        'ticket_id': {
+            'StringValue': ticket_data['ticket_id'],
+            'DataType': 'String'
+        },
+        'status': {
+            'StringValue': ticket_data['status'],
+            'DataType': 'String'
+        }
+    }
+
+def open_tickets_batch(bodies: List[Any]) -> Dict[str, Any]:
+    """
+    Abre vários tickets de uma vez, enviando-os ao SQS via send_message_batch
+    (até 10 mensagens por chamada).
+    
+    Todos os tickets são validados antes do envio; se algum for inválido,
+    nenhum é enviado.
+    """
+    if not bodies:
+        return build_response(400, {
+            'success': False,
+            'message': 'Nenhum ticket informado'
+        })
+    
+    for i, body in enumerate(bodies):
+        if not isinstance(body, dict):
+            return build_response(400, {
+                'success': False,
+                'message': f'Ticket {i}: deve ser um objeto'
+            })
+        
+        is_valid, error_message = validate_required_fields(body)
+        if not is_valid:
+            return build_response(400, {
+                'success': False,
+                'message': f'Ticket {i}: {error_message}'
+            })
+    
+    timestamp = datetime.utcnow().isoformat()
+    tickets = [build_ticket(body, timestamp) for body in bodies]
+    
+    if not QUEUE_URL:
+        # Modo de desenvolvimento - apenas retorna sucesso
+        return build_response(201, {
+            'success': True,
+            'message': 'Tickets criados com sucesso (modo desenvolvimento)',
+            'tickets': tickets
+        })
+    
+    # Import local: o boto3 já foi carregado por get_sqs_client
+    from botocore.exceptions import BotoCoreError, ClientError
+    
+    sqs = get_sqs_client()
+    falhas = {}
+    for inicio in range(0, len(tickets), SQS_BATCH_SIZE):
+        lote = list(enumerate(tickets[inicio:inicio + SQS_BATCH_SIZE], inicio))
+        try:
+            response = sqs.send_message_batch(
+                QueueUrl=QUEUE_URL,
+                Entries=[
+                    {
+                        'Id': str(i),
+                        'MessageBody': build_message_body(ticket_data),
+                        'MessageAttributes': build_message_attributes(ticket_data)
+                    }
+                    for i, ticket_data in lote
+                ]
+            )
+        except (BotoCoreError, ClientError) as e:
+            # Os lotes anteriores já foram enviados: marca só este lote como erro
+            print(f"Erro ao enviar lote de tickets para o SQS: {str(e)}")
+            for i, _ in lote:
+                falhas[i] = str(e)
+            continue
+        
+        for falha in response.get('Failed', []):
+            print(f"Erro ao enviar ticket {falha.get('Id')} para o SQS: {falha.get('Code')} - {falha.get('Message')}")
+            falhas[int(falha['Id'])] = falha.get('Message', falha.get('Code'))
+    
+    resultado = []
+    for i, ticket_data in enumerate(tickets):
+        item = {'ticket_id': ticket_data['ticket_id'], 'status': ticket_data['status']}
+        if i in falhas:
+            item['status'] = 'ERRO'
+            item['erro'] = falhas[i]
+        resultado.append(item)
+    
+    if len(falhas) == len(tickets):
+        return build_response(502, {
+            'success': False,
+            'message': 'Nenhum ticket foi enviado',
+            'tickets': resultado
+        })
+    
+    if falhas:
+        return build_response(207, {
+            'success': False,
+            'message': f'{len(falhas)} de {len(tickets)} tickets não foram enviados',
+            'tickets': resultado
+        })
+    
+    return build_response(201, {
+        'success': True,
+        'message': 'Tickets criados com sucesso',
+        'tickets': resultado
+    })
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Handler principal da Lambda ABRE_TICKET.
     
     Recebe dados do ticket via API Gateway e envia para fila SQS.
+    Um body com uma lista de tickets é enviado em lote.
     """
     try:
         # Extrai o body da requisição
         if isinstance(event.get('body'), str):
-            body = json.loads(event['body'])
+            # Rejeita bodies grandes antes do parse (o número de caracteres
+            # nunca excede o de bytes, então o encode só ocorre abaixo do limite)
+            if len(event['body']) > MAX_BODY_SIZE or len(event['body'].encode()) > MAX_BODY_SIZE:
+                return build_response(413, {
+                    'success': False,
+                    'message': 'Payload muito grande'
+                })
+            
+            body = orjson.loads(event['body'])
         else:
             body = event.get('body', {})
         
+        # Abertura em lote
+        if isinstance(body, list):
+            return open_tickets_batch(body)
+        
         # Valida campos obrigatórios
         is_valid, error_message = validate_required_fields(body)
         if not is_valid:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'message': error_message
-                })
-            }
+            return build_response(400, {
+                'success': False,
+                'message': error_message
+            })
         
-        # Gera ID único para o ticket
-        ticket_id = str(uuid.uuid4())
-        timestamp = datetime.utcnow().isoformat()
-        
-        # Monta objeto do ticket
-        ticket_data = {
-            'ticket_id': ticket_id,
-            'status': 'PENDENTE',
-            'data_abertura': timestamp,
-            'nome_completo': body['nome_completo'],
-            'cpf': body['cpf'],
-            'email': body['email'],
-            'telefone': body['telefone'],
-            'endereco': body['endereco'],
-            'aparelho': body['aparelho'],
-            'observacoes': body.get('observacoes', ''),
-            'created_at': timestamp
-        }
+        # Monta objeto do ticket (com ID único)
+        ticket_data = build_ticket(body, datetime.utcnow().isoformat())
+        ticket_id = ticket_data['ticket_id']
         
         # Envia para fila SQS
         if QUEUE_URL:
-            response = sqs.send_message(
+            response = get_sqs_client().send_message(
                 QueueUrl=QUEUE_URL,
-                MessageBody=json.dumps(ticket_data),
-                MessageAttributes={
-                    'ticket_id': {
-                        'StringValue': ticket_id,
-                        'DataType': 'String'
-                    },
-                    'status': {
-                        'StringValue': 'PENDENTE',
-                        'DataType': 'String'
-                    }
-                }
+                MessageBody=build_message_body(ticket_data),
+                MessageAttributes=build_message_attributes(ticket_data)
             )
             
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': True,
-                    'message': 'Ticket criado com sucesso',
-                    'ticket_id': ticket_id,
-                    'status': 'PENDENTE',
-                    'sqs_message_id': response.get('MessageId')
-                })
-            }
+            return build_response(201, {
+                'success': True,
+                'message': 'Ticket criado com sucesso',
+                'ticket_id': ticket_id,
+                'status': 'PENDENTE',
+                'sqs_message_id': response.get('MessageId')
+            })
         else:
             # Modo de desenvolvimento - apenas retorna sucesso
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': True,
-                    'message': 'Ticket criado com sucesso (modo desenvolvimento)',
-                    'ticket_id': ticket_id,
-                    'status': 'PENDENTE',
-                    'ticket_data': ticket_data
-                })
-            }
-    
-    except json.JSONDecodeError:
-        return {
-            'statusCode': 400,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'success': False,
-                'message': 'JSON inválido no body da requisição'
+            return build_response(201, {
+                'success': True,
+                'message': 'Ticket criado com sucesso (modo desenvolvimento)',
+                'ticket_id': ticket_id,
+                'status': 'PENDENTE',
+                'ticket_data': ticket_data
             })
-        }
+    
+    except orjson.JSONDecodeError:
+        return build_response(400, {
+            'success': False,
+            'message': 'JSON inválido no body da requisição'
+        })
     
     except Exception as e:
         print(f"Erro ao processar ticket: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'success': False,
-                'message': f'Erro interno do servidor: {str(e)}'
-            })
-        }
+        return build_response(500, {
+            'success': False,
+            'message': f'Erro interno do servidor: {str(e)}'
+        })
 
@@ -1,17 +1,102 @@
-import json
+from __future__ import annotations
+
 import boto3
-from datetime import datetime
-from typing import Dict, Any
+import orjson
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional
 import os
-
-# Clientes AWS
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+import random
+import threading
+import time
 
 # Variáveis de ambiente
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE', 'tickets')
 SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN')
 
+# Clientes AWS (criados no INIT e reutilizados nas invocações warm)
+CFG = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    connect_timeout=1,
+    read_timeout=3
+)
+# O DynamoDB tem um orçamento de retentativas pequeno: o throttling é tratado
+# pelo backoff de save_to_dynamodb, que precisa caber no timeout da Lambda
+DYNAMODB_CFG = Config(
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'max_attempts': 2},
+    connect_timeout=1,
+    read_timeout=3
+)
+dynamodb = boto3.resource('dynamodb', config=DYNAMODB_CFG)
+sns = boto3.client('sns', config=CFG)
+TABLE = dynamodb.Table(DYNAMODB_TABLE_NAME) if DYNAMODB_TABLE_NAME else None
+
+# Limite de entradas por chamada do SNS publish_batch
+SNS_BATCH_SIZE = 10
+
+# Template da notificação enviada ao usuário
+NOTIFICATION_TEMPLATE = """
+Olá {nome_completo},
+
+Seu ticket de troca de aparelho foi processado.
+
+ID do Ticket: {ticket_id}
+Status: {status}
+Motivo: {motivo}
+
+Aparelho: {marca} {modelo}
+Número de Série: {numero_serie}
+
+Data de Abertura: {data_abertura}
+
+Em caso de dúvidas, entre em contato conosco.
+
+Atenciosamente,
+Equipe de Garantia
+        """
+
+# Retentativas de escrita no DynamoDB em caso de throttling
+DYNAMODB_MAX_ATTEMPTS = 5
+THROTTLING_ERRORS = frozenset({'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded'})
+
+# Erros do DynamoDB que rejeitam o item em si (o ticket é descartado)
+ITEM_ERRORS = frozenset({'ValidationException'})
+
+# Tempo máximo de espera pelo warm-up das conexões no INIT (segundos)
+WARM_UP_TIMEOUT = 3
+
+# Prazo máximo de garantia (12 meses)
+GARANTIA_MAXIMA = timedelta(days=365)
+
+def warm_up():
+    """
+    Abre as conexões com DynamoDB e SNS durante o INIT da Lambda.
+    
+    O handshake TCP/TLS e a resolução de endpoints acontecem antes da primeira
+    invocação (no INIT da concorrência provisionada) e as invocações seguintes
+    reutilizam as conexões do pool. Falhas aqui não impedem o processamento.
+    """
+    if DYNAMODB_TABLE_NAME:
+        try:
+            dynamodb.meta.client.describe_table(TableName=DYNAMODB_TABLE_NAME)
+        except Exception as e:
+            print(f"Erro no warm-up do DynamoDB: {str(e)}")
+    
+    if SNS_TOPIC_ARN:
+        try:
+            sns.get_topic_attributes(TopicArn=SNS_TOPIC_ARN)
+        except Exception as e:
+            print(f"Erro no warm-up do SNS: {str(e)}")
+
+# O warm-up roda em uma thread com prazo: se os endpoints não responderem,
+# o INIT segue sem esperar as retentativas dos clients (limite de 10 s do INIT)
+_warm_up_thread = threading.Thread(target=warm_up, daemon=True)
+_warm_up_thread.start()
+_warm_up_thread.join(WARM_UP_TIMEOUT)
+
 def process_ticket(ticket_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Processa o ticket e determina se será aceito ou não.
@@ -29,11 +114,13 @@ def process_ticket(ticket_data: Dict[str, Any]) -> Dict[str, Any]:
         data_compra = ticket_data['aparelho'].get('data_compra')
         if data_compra:
             data_compra_obj = datetime.fromisoformat(data_compra.replace('Z', '+00:00'))
-            meses_garantia = (datetime.utcnow() - data_compra_obj.replace(tzinfo=None)).days / 30
+            if data_compra_obj.tzinfo is None:
+                data_compra_obj = data_compra_obj.replace(tzinfo=timezone.utc)
+            tempo_compra = datetime.now(timezone.utc) - data_compra_obj
             
-            if meses_garantia > 12:
+            if tempo_compra > GARANTIA_MAXIMA:
                 status = 'REJEITADO'
-                motivo = f'Aparelho fora da garantia. Comprado há {meses_garantia:.1f} meses.'
+                motivo = f'Aparelho fora da garantia. Comprado há {tempo_compra.days / 30:.1f} meses.'
                 return {'status': status, 'motivo': motivo}
         
         # Verifica nota fiscal
@@ -60,135 +147,218 @@ def process_ticket(ticket_data: Dict[str, Any]) -> Dict[str, Any]:
     
     return {'status': status, 'motivo': motivo}
 
-def save_to_dynamodb(table, ticket_data: Dict[str, Any], processamento: Dict[str, Any]):
+def build_item(ticket_data: Dict[str, Any], processamento: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Salva ou atualiza o ticket no DynamoDB.
+    Monta o item do ticket a ser gravado no DynamoDB.
     """
-    try:
-        item = {
-            'ticket_id': ticket_data['ticket_id'],
-            'status': processamento['status'],
-            'data_abertura': ticket_data['data_abertura'],
-            'data_processamento': datetime.utcnow().isoformat(),
-            'nome_completo': ticket_data['nome_completo'],
-            'cpf': ticket_data['cpf'],
-            'email': ticket_data['email'],
-            'telefone': ticket_data['telefone'],
-            'endereco': ticket_data['endereco'],
-            'aparelho': ticket_data['aparelho'],
-            'observacoes': ticket_data.get('observacoes', ''),
-            'motivo_processamento': processamento['motivo'],
-            'updated_at': datetime.utcnow().isoformat()
+    return {
+        'ticket_id': ticket_data['ticket_id'],
+        'status': processamento['status'],
+        'data_abertura': ticket_data['data_abertura'],
+        'data_processamento': ticket_data['data_processamento'],
+        'nome_completo': ticket_data['nome_completo'],
+        'cpf': ticket_data['cpf'],
+        'email': ticket_data['email'],
+        'telefone': ticket_data['telefone'],
+        'endereco': ticket_data['endereco'],
+        'aparelho': ticket_data['aparelho'],
+        'observacoes': ticket_data.get('observacoes', ''),
+        'motivo_processamento': processamento['motivo']
+    }
+
+def save_items_individually(items: List[Dict[str, Any]]) -> List[str]:
+    """
+    Grava os tickets um a um, descartando apenas os itens rejeitados pelo DynamoDB.
+    
+    Retorna os ticket_ids que não foram gravados. Qualquer outro erro
+    (throttling, permissão, tabela inexistente, falha do serviço) é propagado
+    para que o SQS reentregue as mensagens.
+    """
+    falhas = []
+    for item in items:
+        try:
+            TABLE.put_item(Item=item)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ITEM_ERRORS:
+                raise
+            print(f"Erro ao salvar ticket {item['ticket_id']} no DynamoDB: {str(e)}")
+            falhas.append(item['ticket_id'])
+        except (TypeError, ValueError) as e:
+            print(f"Erro ao salvar ticket {item['ticket_id']} no DynamoDB: {str(e)}")
+            falhas.append(item['ticket_id'])
+    return falhas
+
+def save_to_dynamodb(items: List[Dict[str, Any]]) -> List[str]:
+    """
+    Salva ou atualiza os tickets no DynamoDB.
+    
+    Usa o batch_writer da tabela: os itens são agrupados em chamadas
+    BatchWriteItem (até 25 itens) e os UnprocessedItems são reenviados pelo boto3.
+    Em caso de throttling o lote é regravado com backoff exponencial (com jitter);
+    throttling persistente é propagado para que o SQS reentregue as mensagens.
+    Se o lote for rejeitado por um item inválido, os itens são gravados um a um
+    para que só os tickets inválidos sejam descartados; os demais erros são
+    propagados.
+    
+    Retorna os ticket_ids que não foram gravados.
+    """
+    for attempt in range(DYNAMODB_MAX_ATTEMPTS):
+        try:
+            with TABLE.batch_writer(overwrite_by_pkeys=['ticket_id']) as writer:
+                for item in items:
+                    writer.put_item(Item=item)
+            return []
+        
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ITEM_ERRORS:
+                print(f"Erro ao salvar lote no DynamoDB ({code}). Gravando item a item.")
+                return save_items_individually(items)
+            
+            if code not in THROTTLING_ERRORS or attempt == DYNAMODB_MAX_ATTEMPTS - 1:
+                raise
+            
+            print(f"Throttling no DynamoDB ({code}), tentativa {attempt + 1}")
+            time.sleep(min(2 ** attempt * 0.05 + random.random() * 0.05, 2))
+        
+        except (TypeError, ValueError) as e:
+            print(f"Erro ao salvar lote no DynamoDB: {str(e)}. Gravando item a item.")
+            return save_items_individually(items)
+
+def build_notification(ticket_data: Dict[str, Any], processamento: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Monta a entrada de publish_batch do SNS com a notificação do ticket.
+    """
+    subject = f"Status do Ticket #{ticket_data['ticket_id'][:8]}"
+    
+    aparelho = ticket_data['aparelho']
+    message = NOTIFICATION_TEMPLATE.format_map({
+        'nome_completo': ticket_data['nome_completo'],
+        'ticket_id': ticket_data['ticket_id'],
+        'status': processamento['status'],
+        'motivo': processamento['motivo'],
+        'marca': aparelho.get('marca'),
+        'modelo': aparelho.get('modelo'),
+        'numero_serie': aparelho.get('numero_serie'),
+        'data_abertura': ticket_data['data_abertura']
+    })
+    
+    return {
+        'Id': ticket_data['ticket_id'][:80],
+        'Message': message,
+        'Subject': subject,
+        'MessageAttributes': {
+            'ticket_id': {
+                'DataType': 'String',
+                'StringValue': ticket_data['ticket_id']
+            },
+            'status': {
+                'DataType': 'String',
+                'StringValue': processamento['status']
+            },
+            'email': {
+                'DataType': 'String',
+                'StringValue': ticket_data['email']
+            }
         }
+    }
+
+def publish_notifications(lote: List[Dict[str, Any]]):
+    """
+    Publica um lote de até 10 notificações via SNS publish_batch.
+    """
+    try:
+        response = sns.publish_batch(
+            TopicArn=SNS_TOPIC_ARN,
+            PublishBatchRequestEntries=lote
+        )
+        
+        for falha in response.get('Failed', []):
+            print(f"Erro ao enviar notificação {falha.get('Id')}: {falha.get('Code')} - {falha.get('Message')}")
         
-        table.put_item(Item=item)
-        return True
+        print(f"Notificações enviadas: {len(response.get('Successful', []))}")
+    
     except Exception as e:
-        print(f"Erro ao salvar no DynamoDB: {str(e)}")
-        return False
+        print(f"Erro ao enviar notificações: {str(e)}")
 
-def notify_user(ticket_data: Dict[str, Any], processamento: Dict[str, Any]):
+def notify_users(entries: List[Dict[str, Any]]):
     """
-    Envia notificação ao usuário via SNS.
+    Envia as notificações aos usuários via SNS publish_batch (até 10 por chamada).
     """
     if not SNS_TOPIC_ARN:
         print("SNS_TOPIC_ARN não configurado. Pulando notificação.")
         return
     
-    try:
-        subject = f"Status do Ticket #{ticket_data['ticket_id'][:8]}"
-        
-        message = f"""
-Olá {ticket_data['nome_completo']},
+    for i in range(0, len(entries), SNS_BATCH_SIZE):
+        publish_notifications(entries[i:i + SNS_BATCH_SIZE])
 
-Seu ticket de troca de aparelho foi processado.
-
-ID do Ticket: {ticket_data['ticket_id']}
-Status: {processamento['status']}
-Motivo: {processamento['motivo']}
-
-Aparelho: {ticket_data['aparelho'].get('marca')} {ticket_data['aparelho'].get('modelo')}
-Número de Série: {ticket_data['aparelho'].get('numero_serie')}
-
-Data de Abertura: {ticket_data['data_abertura']}
-
-Em caso de dúvidas, entre em contato conosco.
-
-Atenciosamente,
-Equipe de Garantia
-        """
-        
-        sns.publish(
-            TopicArn=SNS_TOPIC_ARN,
-            Message=message,
-            Subject=subject,
-            MessageAttributes={
-                'ticket_id': {
-                    'DataType': 'String',
-                    'StringValue': ticket_data['ticket_id']
-                },
-                'status': {
-                    'DataType': 'String',
-                    'StringValue': processamento['status']
-                },
-                'email': {
-                    'DataType': 'String',
-                    'StringValue': ticket_data['email']
-                }
-            }
-        )
-        
-        print(f"Notificação enviada para {ticket_data['email']}")
+def parse_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Extrai o ticket do body de uma mensagem SQS.
     
+    Retorna None (após registrar o erro) quando a mensagem é inválida.
+    """
+    try:
+        body = orjson.loads(record['body'])
+        ticket_data = body if isinstance(body, dict) else orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        print(f"Erro ao decodificar JSON da mensagem SQS: {str(e)}")
+        return None
     except Exception as e:
-        print(f"Erro ao enviar notificação: {str(e)}")
+        print(f"Erro ao processar record: {str(e)}")
+        return None
+    
+    if not isinstance(ticket_data, dict):
+        print("Erro ao processar record: body da mensagem não é um ticket")
+        return None
+    
+    print(f"Processando ticket: {ticket_data.get('ticket_id')}")
+    return ticket_data
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Handler principal da Lambda PROCESSAMENTO_TICKET.
     
     Processa mensagens da fila SQS, valida tickets e notifica usuários.
+    O batch é tratado em fases: parse, regras de negócio, gravação em lote
+    no DynamoDB e notificação em lote via SNS.
     """
-    table = dynamodb.Table(DYNAMODB_TABLE_NAME)
+    # Extrai os tickets das mensagens SQS
+    tickets = [ticket_data for ticket_data in map(parse_record, event.get('Records', [])) if ticket_data is not None]
+    
+    # Processa os tickets (validações de negócio)
+    resultados = [process_ticket(ticket_data) for ticket_data in tickets]
     
-    # Processa cada record da fila SQS
-    for record in event.get('Records', []):
+    # Atualiza o status e agrupa o item do DynamoDB e a notificação (um por ticket dentro do batch)
+    now_iso = datetime.utcnow().isoformat()
+    itens = {}
+    notificacoes = {}
+    for ticket_data, processamento in zip(tickets, resultados):
         try:
-            # Extrai o body da mensagem SQS
-            body = json.loads(record['body'])
-            ticket_data = body if isinstance(body, dict) else json.loads(body)
-            
-            print(f"Processando ticket: {ticket_data.get('ticket_id')}")
-            
-            # Processa o ticket (validações de negócio)
-            processamento = process_ticket(ticket_data)
-            
-            # Atualiza status no ticket
             ticket_data['status'] = processamento['status']
-            ticket_data['data_processamento'] = datetime.utcnow().isoformat()
+            ticket_data['data_processamento'] = now_iso
             ticket_data['motivo_processamento'] = processamento['motivo']
             
-            # Salva no DynamoDB
-            save_to_dynamodb(table, ticket_data, processamento)
-            
-            # Notifica o usuário via SNS
-            notify_user(ticket_data, processamento)
+            itens[ticket_data['ticket_id']] = build_item(ticket_data, processamento)
+            notificacoes[ticket_data['ticket_id']] = build_notification(ticket_data, processamento)
             
             print(f"Ticket {ticket_data.get('ticket_id')} processado com status: {processamento['status']}")
         
-        except json.JSONDecodeError as e:
-            print(f"Erro ao decodificar JSON da mensagem SQS: {str(e)}")
-            continue
-        
         except Exception as e:
             print(f"Erro ao processar record: {str(e)}")
             continue
     
+    # Salva no DynamoDB; throttling persistente retorna o batch para a fila SQS
+    falhas = save_to_dynamodb(list(itens.values())) if itens else []
+    
+    # Notifica os usuários via SNS somente após a gravação no DynamoDB
+    notify_users([notificacao for ticket_id, notificacao in notificacoes.items() if ticket_id not in falhas])
+    
     return {
         'statusCode': 200,
-        'body': json.dumps({
+        'body': orjson.dumps({
             'message': 'Tickets processados com sucesso',
             'processed': len(event.get('Records', []))
-        })
+        }).decode()
     }
 